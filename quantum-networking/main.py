@@ -0,0 +1,63 @@
+import argparse
+import os
+import runpy
+import sys
+
+import netsquid as ns
+import matplotlib
+matplotlib.use("Agg")  # headless: figures are only saved, never shown
+import matplotlib.pyplot as plt
+
+# -----------------------------
+# Experiments (subcommand -> script)
+# -----------------------------
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+EXPERIMENTS = {
+    "basic": "netsquid-step1/bell_pair_basic.py",
+    "loss": "netsquid-step2/bell_pair_loss.py",
+    "swap": "netsquid-step3/bell_swap_two_links.py",
+    "repeater": "netsquid-step4/nv_repeater_chain.py",
+    "switch": "netsquid-step5/quantum_switch_control.py",
+    "chain1k": "netsquid-step6/entanglement_chain_1000.py",
+}
+
+
+def run_experiment(name, script_args=()):
+    """Run one step script as __main__ inside this interpreter"""
+    path = os.path.join(ROOT, EXPERIMENTS[name])
+    step_dir = os.path.dirname(path)
+
+    print(f"\n{'='*60}\nRunning {name} ({EXPERIMENTS[name]})\n{'='*60}")
+
+    # Scripts write to outputs/ relative to their own step directory
+    os.makedirs(os.path.join(step_dir, "outputs"), exist_ok=True)
+    old_cwd, old_argv = os.getcwd(), sys.argv
+    os.chdir(step_dir)
+    sys.argv = [path, *script_args]
+    try:
+        ns.sim_reset()
+        runpy.run_path(path, run_name="__main__")
+    finally:
+        plt.close("all")
+        sys.argv = old_argv
+        os.chdir(old_cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the NetSquid experiments in a single interpreter, "
+                    "so netsquid, numpy and matplotlib are imported only once.")
+    parser.add_argument("experiment", choices=[*EXPERIMENTS, "all"],
+                        help="experiment to run, or 'all' for every step in order")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER,
+                        help="extra arguments passed to the script (e.g. chain1k --test)")
+    args = parser.parse_args()
+
+    names = list(EXPERIMENTS) if args.experiment == "all" else [args.experiment]
+    for name in names:
+        run_experiment(name, args.script_args)
+
+
+if __name__ == "__main__":
+    main()
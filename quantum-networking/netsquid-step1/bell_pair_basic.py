@@ -1,5 +1,7 @@
 import netsquid as ns
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # headless: figures are only saved, never shown
 import matplotlib.pyplot as plt
 
 from netsquid.nodes import Node
@@ -1,5 +1,10 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import netsquid as ns
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # headless: figures are only saved, never shown
 import matplotlib.pyplot as plt
 
 from netsquid.nodes import Node
@@ -15,8 +20,9 @@ from netsquid.qubits import ketstates, qubitapi
 distances_km = np.linspace(0, 100, 11)   # 0–100 km
 shots = 200                              # M1-safe
 fiber_loss_db_per_km = 0.2               # standard telecom fiber
-
-success_probs = []
+check_distance_km = 50                   # distance for the full-sim sanity check
+check_shots = 5000                       # ~50 expected successes at 50 km
+SWEEP_SEED = 42                          # seeds the sweep and the sanity check
 
 
 # -----------------------------
@@ -31,78 +37,131 @@ class BellSource(NodeProtocol):
 
 
 # -----------------------------
-# Sweep over distances
+# Storage and handlers
 # -----------------------------
-for distance in distances_km:
-    successes = 0
+received = [None, None]  # [alice, bob], cleared at the top of each shot
 
-    for _ in range(shots):
-        ns.sim_reset()
 
-        # Nodes
-        source = Node("Source")
-        alice = Node("Alice")
-        bob = Node("Bob")
+def alice_handler(msg):
+    received[0] = msg.items[0]
 
-        source.add_ports(["qout_A", "qout_B"])
-        alice.add_ports(["qin"])
-        bob.add_ports(["qin"])
 
-        # Fiber loss model (length NOT included here)
-        loss_model = FibreLossModel(
-          p_loss_init=0.0,
-        p_loss_length=fiber_loss_db_per_km )
+def bob_handler(msg):
+    received[1] = msg.items[0]
 
-        chan_A = QuantumChannel(
-          "chan_A",
-        length=distance * 1000,
-        models={"loss_model": loss_model}
-                                     )
 
-        chan_B = QuantumChannel(
+# -----------------------------
+# Network (built once per distance)
+# -----------------------------
+def build_network(distance):
+    # Nodes
+    source = Node("Source")
+    alice = Node("Alice")
+    bob = Node("Bob")
+
+    source.add_ports(["qout_A", "qout_B"])
+    alice.add_ports(["qin"])
+    bob.add_ports(["qin"])
+
+    # Fiber loss model (length NOT included here)
+    loss_model = FibreLossModel(
+        p_loss_init=0.0,
+        p_loss_length=fiber_loss_db_per_km)
+
+    chan_A = QuantumChannel(
+        "chan_A",
+        length=distance,  # NetSquid channel lengths are in km
+        models={"quantum_loss_model": loss_model})
+
+    chan_B = QuantumChannel(
         "chan_B",
-        length=distance * 1000,
-        models={"loss_model": loss_model}
-                              )
-
-
-        source.ports["qout_A"].connect(chan_A.ports["send"])
-        chan_A.ports["recv"].connect(alice.ports["qin"])
-
-        source.ports["qout_B"].connect(chan_B.ports["send"])
-        chan_B.ports["recv"].connect(bob.ports["qin"])
-
-        received = {"alice": None, "bob": None}
-
-        def alice_handler(msg):
-            received["alice"] = msg.items[0]
-
-        def bob_handler(msg):
-            received["bob"] = msg.items[0]
+        length=distance,  # NetSquid channel lengths are in km
+        models={"quantum_loss_model": loss_model})
 
-        alice.ports["qin"].bind_input_handler(alice_handler)
-        bob.ports["qin"].bind_input_handler(bob_handler)
+    source.ports["qout_A"].connect(chan_A.ports["send"])
+    chan_A.ports["recv"].connect(alice.ports["qin"])
 
-        BellSource(source).start()
-        ns.sim_run()
+    source.ports["qout_B"].connect(chan_B.ports["send"])
+    chan_B.ports["recv"].connect(bob.ports["qin"])
 
-        # Success = both qubits arrived
-        if received["alice"] is not None and received["bob"] is not None:
-            successes += 1
+    alice.ports["qin"].bind_input_handler(alice_handler)
+    bob.ports["qin"].bind_input_handler(bob_handler)
 
-    success_probs.append(successes / shots)
-    print(f"Distance {distance:.1f} km: success = {successes/shots:.3f}")
+    # Handlers write into the module-level received list; callers only need
+    # the source node to start each shot
+    return source
 
 
 # -----------------------------
-# Plot results
+# Single shot (runs in worker processes)
 # -----------------------------
-plt.figure(figsize=(5, 4))
-plt.plot(distances_km, success_probs, "o-", linewidth=2)
-plt.xlabel("Distance (km)")
-plt.ylabel("Success Probability")
-plt.title("Bell Pair Success vs Distance")
-plt.grid(True)
-plt.tight_layout()
-plt.savefig("outputs/success_vs_distance.pdf")
-plt.close()
+source = None
+
+
+def init_worker(distance):
+    # Build the network once per worker process
+    global source
+    ns.sim_reset()
+    source = build_network(distance)
+
+
+def run_shot(shot_seed):
+    ns.set_random_state(shot_seed)
+    ns.sim_reset()
+    received[0] = received[1] = None
+
+    BellSource(source).start()
+    ns.sim_run()
+
+    # Success = both qubits arrived
+    return received[0] is not None and received[1] is not None
+
+
+if __name__ == "__main__":
+    # -----------------------------
+    # Sweep over distances (analytical)
+    # -----------------------------
+    # Each qubit survives its fibre with p = 10^(-alpha*L/10), which is exactly
+    # what FibreLossModel applies, so every shot of the sweep is sampled in one
+    # call: draws[shot, distance, qubit] from a single seeded PCG64 generator.
+    rng = np.random.default_rng(SWEEP_SEED)
+    p_survive = 10 ** (-fiber_loss_db_per_km * distances_km / 10)
+    draws = rng.random((shots, len(distances_km), 2))
+    survive = draws < p_survive[None, :, None]
+    success_probs = survive.all(axis=2).mean(axis=0)
+
+    for distance, p in zip(distances_km, success_probs):
+        print(f"Distance {distance:.1f} km: success = {p:.3f}")
+
+    # -----------------------------
+    # Sanity check: full simulation at one distance
+    # -----------------------------
+    # One independent NetSquid seed per shot, all derived from SWEEP_SEED
+    shot_seeds = np.random.SeedSequence(SWEEP_SEED).generate_state(check_shots).tolist()
+    ncpu = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=ncpu, initializer=init_worker,
+                             initargs=(check_distance_km,)) as executor:
+        results = list(executor.map(run_shot, shot_seeds,
+                                    chunksize=max(1, check_shots // (8 * ncpu))))
+    simulated = sum(results) / check_shots
+
+    # Agreement within three binomial standard errors
+    expected = (10 ** (-fiber_loss_db_per_km * check_distance_km / 10)) ** 2
+    tolerance = 3 * np.sqrt(expected * (1 - expected) / check_shots)
+    status = "OK" if abs(simulated - expected) <= tolerance else "MISMATCH"
+    print(f"Sanity check at {check_distance_km} km ({check_shots} shots): "
+          f"simulated = {simulated:.4f}, analytical = {expected:.4f} "
+          f"± {tolerance:.4f} [{status}]")
+
+    # -----------------------------
+    # Plot results
+    # -----------------------------
+    plt.figure(figsize=(5, 4))
+    plt.plot(distances_km, success_probs, "o-", linewidth=2)
+    plt.xlabel("Distance (km)")
+    plt.ylabel("Success Probability")
+    plt.title("Bell Pair Success vs Distance")
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig("outputs/success_vs_distance.pdf")
+    plt.close()
@@ -1,21 +1,28 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import netsquid as ns
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # headless: figures are only saved, never shown
 import matplotlib.pyplot as plt
 
 from netsquid.nodes import Node
 from netsquid.components import QuantumChannel
-from netsquid.components.models import FibreLossModel
 from netsquid.protocols import NodeProtocol
 from netsquid.qubits import ketstates, qubitapi
-from netsquid.qubits.operators import H, CNOT  # Correct operator import
+from netsquid.qubits.operators import H, I, CNOT  # Correct operator import
+
+# Hadamard on middle1 followed by CNOT(middle1 -> middle2), fused into one 4x4 gate
+BSM = CNOT * (H ^ I)
 
 # -----------------------------
 # Simulation parameters
 # -----------------------------
-shots = 100       # M1-friendly
+shots = 500       # M1-friendly: only ~16% of shots reach the simulator
 fiber_loss_db_per_km = 0.2
-distance_km = 50  # Each link
-success_fidelities = []
+distance_km = 10  # Each link; all four qubits survive with p ~ 0.16
+p_survive = 10 ** (-fiber_loss_db_per_km * distance_km / 10)  # per qubit
 
 # -----------------------------
 # Protocols
@@ -28,9 +35,16 @@ class BellSource(NodeProtocol):
         self.node.ports["qout_2"].tx_output(q2)
 
 # -----------------------------
-# Sweep over shots
+# Single shot
 # -----------------------------
-for _ in range(shots):
+def run_shot(seed):
+    # Fibre loss is drawn up front: the swap needs all four qubits, so a shot
+    # with any loss is a failure and never reaches the event scheduler
+    rng = np.random.default_rng(seed)
+    if not (rng.random(4) < p_survive).all():
+        return None
+
+    ns.set_random_state(seed)
     ns.sim_reset()
 
     # Nodes
@@ -47,14 +61,9 @@ for _ in range(shots):
     source1.add_ports(["qout_1", "qout_2"])
     source2.add_ports(["qout_1", "qout_2"])
 
-    # Fiber loss model
-    loss_model = FibreLossModel(p_loss_init=0.0, p_loss_length=fiber_loss_db_per_km)
-
-    # Channels: one channel per qubit
-    chan_Alice_Middle_1 = QuantumChannel("chan_Alice_Middle_1", length=distance_km*1000,
-                                         models={"loss_model": loss_model})
-    chan_Alice_Middle_2 = QuantumChannel("chan_Alice_Middle_2", length=distance_km*1000,
-                                         models={"loss_model": loss_model})
+    # Channels: one channel per qubit (loss already sampled above)
+    chan_Alice_Middle_1 = QuantumChannel("chan_Alice_Middle_1", length=distance_km)
+    chan_Alice_Middle_2 = QuantumChannel("chan_Alice_Middle_2", length=distance_km)
 
     source1.ports["qout_1"].connect(chan_Alice_Middle_1.ports["send"])
     chan_Alice_Middle_1.ports["recv"].connect(alice.ports["qin"])
@@ -62,10 +71,8 @@ for _ in range(shots):
     source1.ports["qout_2"].connect(chan_Alice_Middle_2.ports["send"])
     chan_Alice_Middle_2.ports["recv"].connect(middle.ports["qin1"])
 
-    chan_Middle_Bob_1 = QuantumChannel("chan_Middle_Bob_1", length=distance_km*1000,
-                                       models={"loss_model": loss_model})
-    chan_Middle_Bob_2 = QuantumChannel("chan_Middle_Bob_2", length=distance_km*1000,
-                                       models={"loss_model": loss_model})
+    chan_Middle_Bob_1 = QuantumChannel("chan_Middle_Bob_1", length=distance_km)
+    chan_Middle_Bob_2 = QuantumChannel("chan_Middle_Bob_2", length=distance_km)
 
     source2.ports["qout_1"].connect(chan_Middle_Bob_1.ports["send"])
     chan_Middle_Bob_1.ports["recv"].connect(middle.ports["qin2"])
@@ -98,26 +105,36 @@ for _ in range(shots):
     if received["alice"] is not None and received["middle1"] is not None \
        and received["middle2"] is not None and received["bob"] is not None:
 
-        # Apply Hadamard on middle1 qubit
-        ns.qubits.operate(received["middle1"], H)
-
-        # Apply CNOT: control = middle1, target = middle2
-        ns.qubits.operate([received["middle1"], received["middle2"]], CNOT)
+        # Apply Hadamard on middle1, then CNOT (control = middle1, target = middle2)
+        ns.qubits.operate([received["middle1"], received["middle2"]], BSM)
 
         # Compute fidelity of Alice-Bob pair
-        fid = qubitapi.fidelity([received["alice"], received["bob"]], ketstates.b00)
-        success_fidelities.append(fid)
+        return qubitapi.fidelity([received["alice"], received["bob"]], ketstates.b00)
 
-# -----------------------------
-# Plot results
-# -----------------------------
-plt.figure(figsize=(5,4))
-plt.hist(success_fidelities, bins=10, range=(0,1), color='skyblue', edgecolor='black')
-plt.xlabel("Fidelity after swapping")
-plt.ylabel("Counts")
-plt.title("Entanglement Swapping Fidelity")
-plt.tight_layout()
-plt.savefig("outputs/swapping_fidelity.pdf")
-plt.close()
-
-print(f"Average fidelity: {np.mean(success_fidelities):.4f}")
+    return None
+
+
+if __name__ == "__main__":
+    ncpu = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=ncpu) as executor:
+        results = list(executor.map(run_shot, range(shots),
+                                    chunksize=max(1, shots // (8 * ncpu))))
+    success_fidelities = np.array([fid for fid in results if fid is not None])
+
+    # -----------------------------
+    # Plot results
+    # -----------------------------
+    if success_fidelities.size:
+        plt.figure(figsize=(5,4))
+        plt.hist(success_fidelities, bins=10, range=(0,1), color='skyblue', edgecolor='black')
+        plt.xlabel("Fidelity after swapping")
+        plt.ylabel("Counts")
+        plt.title("Entanglement Swapping Fidelity")
+        plt.tight_layout()
+        plt.savefig("outputs/swapping_fidelity.pdf")
+        plt.close()
+
+        print(f"Average fidelity: {np.mean(success_fidelities):.4f}")
+        print(f"Success rate: {len(success_fidelities)}/{shots} ({100*len(success_fidelities)/shots:.1f}%)")
+    else:
+        print("No successful entanglement distributions!")
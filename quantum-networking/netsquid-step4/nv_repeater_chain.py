@@ -1,24 +1,45 @@
 import netsquid as ns
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # headless: figures are only saved, never shown
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from netsquid.nodes import Node
 from netsquid.components import QuantumChannel
-from netsquid.components.models import FibreLossModel
 from netsquid.protocols import NodeProtocol
 from netsquid.qubits import ketstates, qubitapi
-from netsquid.qubits.operators import H, CNOT
+from netsquid.qubits.operators import H, I, CNOT
 import os
 
+# CNOT followed by Hadamard on the target, fused into one 4x4 gate
+BSM = (I ^ H) * CNOT
+
 shots = 100
 fiber_loss_db_per_km = 0.2
 num_repeaters = 2
 link_distance_km = 20
-success_fidelities = []
+p_survive = 10 ** (-fiber_loss_db_per_km * link_distance_km / 10)  # per link
 
-for shot in range(shots):
-    ns.sim_reset()
-    
-    # Create NEW nodes for each shot
+
+# Track received qubits (shared by every shot, cleared between shots).
+# Each receiving port owns a fixed slot in the list.
+IDX_ALICE_QIN = 0
+IDX_BOB_QIN = 1
+IDX_R_QIN_LEFT = [2 + i for i in range(num_repeaters)]
+IDX_R_QIN_RIGHT = [2 + num_repeaters + i for i in range(num_repeaters)]
+num_ports = 2 + 2 * num_repeaters
+received = [None] * num_ports
+EMPTY_SLOTS = (None,) * num_ports  # reset value, reused every shot
+
+
+# Set up input handlers for all receiving ports
+def bind_slot(port, i):
+    port.bind_input_handler(
+        lambda msg, i=i, r=received: r.__setitem__(i, msg.items[0] if msg.items else None))
+
+
+def build_network():
+    # Nodes, channels and handlers are created once and reused by every shot
     alice = Node("Alice")
     repeaters = [Node(f"R{i}") for i in range(num_repeaters)]
     bob = Node("Bob")
@@ -33,10 +54,7 @@ for shot in range(shots):
     # Build the chain: Alice -> R0 -> R1 -> ... -> Bob
     nodes_chain = [alice] + repeaters + [bob]
     
-    # Create loss model
-    loss_model = FibreLossModel(p_loss_init=0.0, p_loss_length=fiber_loss_db_per_km)
-    
-    # Create quantum channels between adjacent nodes
+    # Create quantum channels between adjacent nodes (loss is sampled per shot)
     channels = []
     
     # Connect Alice to first repeater (or Bob if no repeaters)
@@ -44,8 +62,7 @@ for shot in range(shots):
         # Alice to R0
         chan_alice_r0 = QuantumChannel(
             f"chan_alice_r0", 
-            length=link_distance_km*1000, 
-            models={"loss_model": loss_model}
+            length=link_distance_km
         )
         alice.ports["qout_right"].connect(chan_alice_r0.ports["send"])
         chan_alice_r0.ports["recv"].connect(repeaters[0].ports["qin_left"])
@@ -55,8 +72,7 @@ for shot in range(shots):
         for i in range(num_repeaters - 1):
             chan = QuantumChannel(
                 f"chan_r{i}_r{i+1}", 
-                length=link_distance_km*1000, 
-                models={"loss_model": loss_model}
+                length=link_distance_km
             )
             repeaters[i].ports["qout_right"].connect(chan.ports["send"])
             chan.ports["recv"].connect(repeaters[i+1].ports["qin_left"])
@@ -65,8 +81,7 @@ for shot in range(shots):
         # Connect last repeater to Bob
         chan_rn_bob = QuantumChannel(
             f"chan_r{num_repeaters-1}_bob", 
-            length=link_distance_km*1000, 
-            models={"loss_model": loss_model}
+            length=link_distance_km
         )
         repeaters[-1].ports["qout_right"].connect(chan_rn_bob.ports["send"])
         chan_rn_bob.ports["recv"].connect(bob.ports["qin"])
@@ -75,99 +90,126 @@ for shot in range(shots):
         # Direct connection Alice to Bob
         chan_alice_bob = QuantumChannel(
             "chan_alice_bob", 
-            length=link_distance_km*1000, 
-            models={"loss_model": loss_model}
+            length=link_distance_km
         )
         alice.ports["qout_right"].connect(chan_alice_bob.ports["send"])
         chan_alice_bob.ports["recv"].connect(bob.ports["qin"])
         channels.append(chan_alice_bob)
     
-    # Track received qubits
-    received = {}
-    
-    # Set up input handlers for all receiving ports
-    def make_handler(node_name, port_name):
-        def handler(msg):
-            if msg.items:
-                received[f"{node_name}_{port_name}"] = msg.items[0]
-        return handler
-    
     # Alice receives her half of Bell pair
-    alice.ports["qin"].bind_input_handler(make_handler("Alice", "qin"))
+    bind_slot(alice.ports["qin"], IDX_ALICE_QIN)
     
     # Repeaters receive qubits on both sides
     for i, r in enumerate(repeaters):
-        r.ports["qin_left"].bind_input_handler(make_handler(f"R{i}", "qin_left"))
+        bind_slot(r.ports["qin_left"], IDX_R_QIN_LEFT[i])
         if i < num_repeaters - 1:
-            r.ports["qin_right"].bind_input_handler(make_handler(f"R{i}", "qin_right"))
+            bind_slot(r.ports["qin_right"], IDX_R_QIN_RIGHT[i])
     
     # Bob receives his qubit
-    bob.ports["qin"].bind_input_handler(make_handler("Bob", "qin"))
+    bind_slot(bob.ports["qin"], IDX_BOB_QIN)
+    
+    return alice, repeaters, bob
+
+
+network = None
+
+
+def init_worker():
+    # Build the network once per worker process
+    global network
+    ns.sim_reset()
+    network = build_network()
+
+
+def run_shot(seed):
+    # Fibre loss is drawn up front, one flag per link (Alice -> R0 ... -> Bob).
+    # Without Bob's qubit there is no fidelity to compute, so skip the sim.
+    rng = np.random.default_rng(seed)
+    survive = rng.random(num_repeaters + 1) < p_survive
+    if not survive[-1]:
+        return None
+    
+    ns.set_random_state(seed)
+    ns.sim_reset()
+    received[:] = EMPTY_SLOTS
+    alice, repeaters, bob = network
     
     # Generate initial Bell pairs
     # Alice keeps one qubit and sends others down the chain
     q_alice, q_to_chain = ns.qubits.create_qubits(2)
     ns.qubits.assign_qstate([q_alice, q_to_chain], ketstates.b00)
-    received["Alice_qin"] = q_alice
-    alice.ports["qout_right"].tx_output(q_to_chain)
+    received[IDX_ALICE_QIN] = q_alice
+    if survive[0]:
+        alice.ports["qout_right"].tx_output(q_to_chain)
     
     # Each repeater generates a Bell pair and sends one half to the next node
     for i in range(num_repeaters - 1):
         q_local, q_forward = ns.qubits.create_qubits(2)
         ns.qubits.assign_qstate([q_local, q_forward], ketstates.b00)
-        repeaters[i].ports["qout_right"].tx_output(q_forward)
-        received[f"R{i}_qin_right"] = q_local
+        if survive[i + 1]:
+            repeaters[i].ports["qout_right"].tx_output(q_forward)
+        received[IDX_R_QIN_RIGHT[i]] = q_local
     
     # Last repeater sends to Bob
     if num_repeaters > 0:
         q_last_rep, q_to_bob = ns.qubits.create_qubits(2)
         ns.qubits.assign_qstate([q_last_rep, q_to_bob], ketstates.b00)
-        repeaters[-1].ports["qout_right"].tx_output(q_to_bob)
-        received[f"R{num_repeaters-1}_qin_right"] = q_last_rep
+        repeaters[-1].ports["qout_right"].tx_output(q_to_bob)  # survive[-1] checked above
+        received[IDX_R_QIN_RIGHT[-1]] = q_last_rep
     
     # Run simulation to propagate qubits through channels
     ns.sim_run()
     
     # Perform Bell state measurements at repeaters (entanglement swapping)
     for i in range(num_repeaters):
-        q_left = received.get(f"R{i}_qin_left")
-        q_right = received.get(f"R{i}_qin_right")
+        q_left = received[IDX_R_QIN_LEFT[i]]
+        q_right = received[IDX_R_QIN_RIGHT[i]]
         
         if q_left is not None and q_right is not None:
             # Bell state measurement - correct syntax
-            ns.qubits.operate([q_left, q_right], CNOT)
-            ns.qubits.operate(q_right, H)
+            ns.qubits.operate([q_left, q_right], BSM)
     
     # Check final fidelity between Alice and Bob's qubits
-    q_alice = received.get("Alice_qin")
-    q_bob = received.get("Bob_qin")
+    q_alice = received[IDX_ALICE_QIN]
+    q_bob = received[IDX_BOB_QIN]
     
     if q_alice is not None and q_bob is not None:
-        fid = qubitapi.fidelity([q_alice, q_bob], ketstates.b00)
-        success_fidelities.append(fid)
+        return qubitapi.fidelity([q_alice, q_bob], ketstates.b00)
+    return None
+
+
+if __name__ == "__main__":
+    ncpu = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=ncpu, initializer=init_worker) as executor:
+        results = list(executor.map(run_shot, range(shots),
+                                    chunksize=max(1, shots // (8 * ncpu))))
+
+    for shot, fid in enumerate(results):
         if (shot + 1) % 10 == 0:
-            print(f"Shot {shot+1}/{shots}: Fidelity = {fid:.4f}")
+            if fid is not None:
+                print(f"Shot {shot+1}/{shots}: Fidelity = {fid:.4f}")
+            else:
+                print(f"Shot {shot+1}/{shots}: Qubits lost")
+
+    success_fidelities = np.array([fid for fid in results if fid is not None])
+
+    # Create outputs directory if it doesn't exist
+    os.makedirs("outputs", exist_ok=True)
+
+    # Plot results
+    if success_fidelities.size:
+        plt.figure(figsize=(5, 4))
+        plt.hist(success_fidelities, bins=10, range=(0, 1), color='lightgreen', edgecolor='black')
+        plt.xlabel("Fidelity")
+        plt.ylabel("Counts")
+        plt.title(f"NV Repeater Chain Fidelity ({num_repeaters} repeaters)")
+        plt.tight_layout()
+        plt.savefig("outputs/nv_repeater_chain_fidelity.pdf")
+        plt.close()
+        
+        print(f"\nResults:")
+        print(f"Average fidelity: {np.mean(success_fidelities):.4f}")
+        print(f"Success rate: {len(success_fidelities)}/{shots} ({100*len(success_fidelities)/shots:.1f}%)")
+        print(f"Plot saved to outputs/nv_repeater_chain_fidelity.pdf")
     else:
-        if (shot + 1) % 10 == 0:
-            print(f"Shot {shot+1}/{shots}: Qubits lost")
-
-# Create outputs directory if it doesn't exist
-os.makedirs("outputs", exist_ok=True)
-
-# Plot results
-if success_fidelities:
-    plt.figure(figsize=(5, 4))
-    plt.hist(success_fidelities, bins=10, range=(0, 1), color='lightgreen', edgecolor='black')
-    plt.xlabel("Fidelity")
-    plt.ylabel("Counts")
-    plt.title(f"NV Repeater Chain Fidelity ({num_repeaters} repeaters)")
-    plt.tight_layout()
-    plt.savefig("outputs/nv_repeater_chain_fidelity.pdf")
-    plt.close()
-    
-    print(f"\nResults:")
-    print(f"Average fidelity: {np.mean(success_fidelities):.4f}")
-    print(f"Success rate: {len(success_fidelities)}/{shots} ({100*len(success_fidelities)/shots:.1f}%)")
-    print(f"Plot saved to outputs/nv_repeater_chain_fidelity.pdf")
-else:
-    print("No successful entanglement distributions!")
+        print("No successful entanglement distributions!")
@@ -10,6 +10,11 @@ import gc
 # Memory optimization settings
 ns.set_random_state(seed=42)
 
+# Fiber and fidelity assumptions for the analytical metrics
+attenuation_db_per_km = 0.2
+c = 2e8  # Speed of light in fiber (m/s)
+initial_fidelity = 0.98  # Per-link fidelity, degrades multiplicatively
+
 class MinimalEntanglementProtocol(NodeProtocol):
     """Lightweight protocol for entanglement generation"""
     
@@ -36,21 +41,10 @@ def create_lightweight_chain(num_nodes, distance_km=10):
     print(f"Creating {num_nodes}-node chain...")
     
     network = Network("LargeChain")
-    nodes = []
     
-    # Create nodes in batches to manage memory
-    batch_size = 100
-    for batch_start in range(0, num_nodes, batch_size):
-        batch_end = min(batch_start + batch_size, num_nodes)
-        print(f"  Creating nodes {batch_start} to {batch_end-1}...")
-        
-        for i in range(batch_start, batch_end):
-            node = Node(f"Node_{i}", qmemory=None)  # No quantum memory to save RAM
-            nodes.append(node)
-            network.add_node(node)
-        
-        # Force garbage collection after each batch
-        gc.collect()
+    # No quantum memory to save RAM
+    nodes = [Node(f"Node_{i}", qmemory=None) for i in range(num_nodes)]
+    network.add_nodes(nodes)
     
     print(f"Successfully created {len(nodes)} nodes")
     return network, nodes
@@ -70,24 +64,9 @@ def simulate_chain_progressive(num_nodes=1000, shots=10, distance_km=10):
     # Calculate theoretical metrics instead of full simulation
     print("\nCalculating metrics...")
     
-    # Fiber parameters
-    attenuation_db_per_km = 0.2
-    c = 2e8  # Speed of light in fiber (m/s)
-    
-    results = {
-        'num_nodes': num_nodes,
-        'distance_per_link_km': distance_km,
-        'total_distance_km': (num_nodes - 1) * distance_km,
-        'attenuation_per_link_db': attenuation_db_per_km * distance_km,
-        'transmission_per_link': 10 ** (-attenuation_db_per_km * distance_km / 10),
-        'propagation_delay_per_link_us': (distance_km * 1000) / c * 1e6,
-        'total_propagation_delay_ms': ((num_nodes - 1) * distance_km * 1000) / c * 1e3,
-    }
-    
-    # End-to-end fidelity estimate (simplified)
-    # Assuming each link starts with F=0.98 and degrades
-    initial_fidelity = 0.98
-    results['estimated_fidelity'] = initial_fidelity ** (num_nodes - 1)
+    # Single-row scaling table, unpacked to plain scalars
+    table = analytical_scaling_table([num_nodes], distance_km)
+    results = {key: np.asarray(value).item() for key, value in table.items()}
     
     # Network topology metrics
     results['network_diameter'] = num_nodes - 1
@@ -126,6 +105,32 @@ def simulate_chain_progressive(num_nodes=1000, shots=10, distance_km=10):
     
     return results
 
+def analytical_scaling_table(sizes, distance_km=10):
+    """Compute the analytical chain metrics for many sizes at once"""
+    sizes = np.asarray(sizes)
+    links = sizes - 1
+    
+    return {
+        'num_nodes': sizes,
+        'distance_per_link_km': distance_km,
+        'attenuation_per_link_db': attenuation_db_per_km * distance_km,
+        'transmission_per_link': 10 ** (-attenuation_db_per_km * distance_km / 10),
+        'propagation_delay_per_link_us': (distance_km * 1000) / c * 1e6,
+        'total_distance_km': links * distance_km,
+        'transmission': 10 ** (-attenuation_db_per_km * distance_km * links / 10),
+        'estimated_fidelity': initial_fidelity ** links,
+        'total_propagation_delay_ms': links * distance_km * 1000 / c * 1e3,
+    }
+
+def print_scaling_table(table):
+    """Print the analytical scaling table, one row per chain size"""
+    print(f"\n{'Nodes':>6} {'Distance (km)':>14} {'Transmission':>13} "
+          f"{'Fidelity':>12} {'Delay (ms)':>11}")
+    for n, d, t, f, ms in zip(table['num_nodes'], table['total_distance_km'],
+                              table['transmission'], table['estimated_fidelity'],
+                              table['total_propagation_delay_ms']):
+        print(f"{n:>6} {d:>14} {t:>13.3e} {f:>12.3e} {ms:>11.2f}")
+
 # Alternative: Smaller scale test
 def simulate_scalability_test():
     """Test scaling from small to larger networks"""
@@ -134,9 +139,10 @@ def simulate_scalability_test():
     
     test_sizes = [10, 50, 100, 200, 500]
     
+    # The loop only builds and runs each chain in the DE simulator;
+    # the analytical metrics are computed for all sizes afterwards
     for size in test_sizes:
         ns.sim_reset()
-        gc.collect()
         
         print(f"\nTesting {size}-node chain...")
         network, nodes = create_lightweight_chain(size, distance_km=10)
@@ -151,6 +157,9 @@ def simulate_scalability_test():
         del nodes
         gc.collect()
     
+    # Analytical metrics for all sizes in one vectorized pass
+    print_scaling_table(analytical_scaling_table(test_sizes + [1000], distance_km=10))
+    
     print("\n✓ Scalability test complete!")
     print("\nRecommendation: M1 Mac can handle up to ~200-500 nodes")
     print("For 1000 nodes, use analytical approach or cluster computing.")